@@ -5,17 +5,26 @@ Supports dynamic pivot operations with flexible aggregations and filtering
 
 from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field, validator
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 import duckdb
+from cachetools import TTLCache
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import orjson
+import io
 import json
 import os
 from datetime import datetime, timedelta
+from decimal import Decimal
 from pathlib import Path
-import hashlib
-import asyncio
-from contextlib import asynccontextmanager
+import xxhash
+import queue
+import threading
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+import uuid
 import logging
 from dotenv import load_dotenv
 
@@ -28,22 +37,49 @@ log_format = os.getenv('LOG_FORMAT', '%(asctime)s - %(name)s - %(levelname)s - %
 logging.basicConfig(level=getattr(logging, log_level), format=log_format)
 logger = logging.getLogger(__name__)
 
+def _orjson_default(value: Any) -> Any:
+    """Encode values orjson does not support natively, such as DECIMAL aggregates
+    and the pandas Timestamp, NA and NaT values of result frames.
+
+    Decimal becomes a float so streamed rows match /pivot/compute, whose
+    result frames already hold DECIMAL aggregates as float64.
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    if value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class PivotJSONResponse(JSONResponse):
+    """JSON response rendered by orjson, falling back to _orjson_default for other values"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
 # Data models for API requests/responses
 class PivotField(BaseModel):
     id: str
     name: str
-    dataType: str = Field(..., regex="^(string|number|date|boolean)$")
+    dataType: str = Field(..., pattern="^(string|number|date|boolean)$")
     format: Optional[str] = None
 
 class PivotValueField(BaseModel):
     field: PivotField
-    aggregation: str = Field(..., regex="^(sum|count|avg|min|max|countDistinct)$")
+    aggregation: str = Field(..., pattern="^(sum|count|avg|min|max|countDistinct)$")
     format: Optional[str] = None
     displayName: Optional[str] = None
 
 class PivotFilter(BaseModel):
     field: PivotField
-    operator: str = Field(..., regex="^(equals|notEquals|contains|notContains|greaterThan|lessThan|greaterThanOrEqual|lessThanOrEqual|in|notIn|between|isEmpty|isNotEmpty)$")
+    operator: str = Field(..., pattern="^(equals|notEquals|contains|notContains|greaterThan|lessThan|greaterThanOrEqual|lessThanOrEqual|in|notIn|between|isEmpty|isNotEmpty)$")
     value: Any
     enabled: bool = True
 
@@ -57,6 +93,25 @@ class PivotConfiguration(BaseModel):
     maxRows: Optional[int] = None
     maxColumns: Optional[int] = None
 
+    def _canonical(self) -> tuple:
+        """Flat tuple of everything that affects the computed result, for hashing"""
+        return (
+            tuple((row.id, row.dataType) for row in self.rows),
+            tuple((col.id, col.dataType) for col in self.columns),
+            tuple(
+                (value_field.field.id, value_field.field.name, value_field.aggregation, value_field.displayName)
+                for value_field in self.values
+            ),
+            tuple(
+                (filter_item.operator, filter_item.field.id, filter_item.value, filter_item.enabled)
+                for filter_item in self.filters
+            ),
+            self.showSubtotals,
+            self.showGrandTotals,
+            self.maxRows,
+            self.maxColumns
+        )
+
 class PivotRequest(BaseModel):
     dataset: str
     configuration: PivotConfiguration
@@ -92,6 +147,22 @@ class PivotStructure(BaseModel):
     totalRows: int
     totalColumns: int
 
+class PivotStructureSoA(BaseModel):
+    """Column-major pivot result: one value list and one formatted list per column"""
+    columns: List[str]
+    values: List[List[Any]]
+    formatted: List[List[str]]
+    rowCount: int
+    columnCount: int
+    totalRows: int
+    totalColumns: int
+
+class PivotColumnarResponse(BaseModel):
+    structure: PivotStructureSoA
+    metadata: Dict[str, Any]
+    hasMore: bool = False
+    error: Optional[Dict[str, Any]] = None
+
 class PivotResponse(BaseModel):
     structure: PivotStructure
     metadata: Dict[str, Any]
@@ -101,7 +172,7 @@ class PivotResponse(BaseModel):
 class PivotDrillRequest(BaseModel):
     cacheKey: str
     path: List[str]
-    action: str = Field(..., regex="^(expand|collapse)$")
+    action: str = Field(..., pattern="^(expand|collapse)$")
 
 class DatasetInfo(BaseModel):
     id: str
@@ -110,8 +181,18 @@ class DatasetInfo(BaseModel):
     rowCount: Optional[int] = None
     path: str
 
+class DatasetMeta(BaseModel):
+    """Cached catalog metadata for a dataset file"""
+    tableName: str
+    source: str
+    tableCount: int
+    fields: List[PivotField]
+    rowCount: int
+    mtime: float
+    parquetMtime: Optional[float] = None
+
 class ExportConfig(BaseModel):
-    format: str = Field(..., regex="^(csv|excel|pdf|json)$")
+    format: str = Field(..., pattern="^(csv|excel|pdf|json)$")
     includeHeaders: bool = True
     includeSubtotals: bool = True
     includeGrandTotals: bool = True
@@ -147,139 +228,366 @@ GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
 # Performance configuration
 MAX_ROWS_PER_QUERY = int(os.getenv('MAX_ROWS_PER_QUERY', '100000'))
 MAX_COLUMNS_PER_QUERY = int(os.getenv('MAX_COLUMNS_PER_QUERY', '1000'))
+PARQUET_ROW_GROUP_SIZE = int(os.getenv('PARQUET_ROW_GROUP_SIZE', '100000'))
+FIELD_VALUES_SAMPLE_PERCENT = float(os.getenv('FIELD_VALUES_SAMPLE_PERCENT', '1'))
+FIELD_VALUES_SAMPLE_SEED = 42
 QUERY_TIMEOUT_SECONDS = int(os.getenv('QUERY_TIMEOUT_SECONDS', '30'))
 
+# DuckDB configuration
+DUCKDB_POOL_SIZE = int(os.getenv('DUCKDB_POOL_SIZE', str(os.cpu_count() or 4)))
+# Count the CPUs this process may run on: in containers the cpuset is often
+# smaller than os.cpu_count()
+_available_cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 4)
+DUCKDB_THREADS = int(os.getenv('DUCKDB_THREADS', str(_available_cpus)))
+DUCKDB_MEMORY_LIMIT = os.getenv('DUCKDB_MEMORY_LIMIT', '4GB')
+DUCKDB_TEMP_DIR = os.getenv('DUCKDB_TEMP_DIR', '/var/tmp/duckdb')
+
+# Streaming configuration
+STREAM_BATCH_ROWS = int(os.getenv('STREAM_BATCH_ROWS', '8192'))
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CACHE_KEY_HEADER = "X-Pivot-Cache-Key"
+
+# Drill-down rollups are materialized in the in-memory catalog each dataset
+# is attached to; GROUPING() over the row dimensions is stored per row
+ROLLUP_SCHEMA = "memory.main"
+ROLLUP_LEVEL_COLUMN = "__grouping"
+
 # Development configuration
 DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'
 TESTING = os.getenv('TESTING', 'false').lower() == 'true'
 
-# In-memory cache for computed pivot results
-pivot_cache: Dict[str, Dict[str, Any]] = {}
+class PivotCache(TTLCache):
+    """TTLCache that reports evicted entries, so their rollup tables can be dropped"""
+
+    def __init__(self, maxsize: int, ttl: float, on_evict):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.on_evict = on_evict
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        for key, value in expired:
+            self.on_evict(key, value)
+        return expired
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.on_evict(key, value)
+        return key, value
+
+def _on_pivot_cache_evict(cache_key: str, cached_data: Dict[str, Any]):
+    """Schedule an evicted entry's rollup table for dropping"""
+    if cached_data.get('rollupTable'):
+        pivot_service.discard_table(cached_data['request'].dataset, cached_data['rollupTable'])
+
+# In-memory cache for computed pivot results, bounded by size and TTL.
+# Threadpool endpoints share it, so every access goes through the lock.
+pivot_cache: PivotCache = PivotCache(
+    maxsize=MAX_CACHE_SIZE,
+    ttl=CACHE_TTL.total_seconds(),
+    on_evict=_on_pivot_cache_evict
+)
+pivot_cache_lock = threading.Lock()
 
 class DuckDBPivotService:
     """Service class for DuckDB pivot operations"""
 
-    def __init__(self, data_path: Path):
+    def __init__(self, data_path: Path, pool_size: int = DUCKDB_POOL_SIZE):
         self.data_path = data_path
-        self.connections: Dict[str, duckdb.DuckDBPyConnection] = {}
-
-    def get_connection(self, dataset: str) -> duckdb.DuckDBPyConnection:
-        """Get or create a DuckDB connection for a dataset"""
-        if dataset not in self.connections:
+        self.pool_size = max(1, pool_size)
+        self.control: Optional[duckdb.DuckDBPyConnection] = None
+        self.attached: Dict[str, str] = {}
+        self.pools: Dict[str, queue.Queue] = {}
+        self._pool_lock = threading.Lock()
+        self._meta_cache: Dict[str, DatasetMeta] = {}
+        self._stale_tables: Dict[str, List[str]] = {}
+        self._stale_lock = threading.Lock()
+
+    def _attach(self, dataset: str) -> str:
+        """Attach a dataset to the control connection, returning its catalog name.
+
+        All datasets share one in-memory database instance (buffer manager,
+        settings, extensions) and are attached to it read-only. The in-memory
+        catalog itself stays writable for drill-down rollups.
+        Callers must hold _pool_lock.
+        """
+        if dataset not in self.attached:
             db_path = self.data_path / f"{dataset}.duckdb"
             if not db_path.exists():
                 raise HTTPException(status_code=404, detail=f"Dataset {dataset} not found")
 
-            self.connections[dataset] = duckdb.connect(str(db_path))
-            logger.info(f"Created connection for dataset: {dataset}")
+            if self.control is None:
+                self.control = duckdb.connect(":memory:")
+                self._configure_connection(self.control)
 
-        return self.connections[dataset]
+            # Prefix catalog names so datasets cannot collide with "memory" or "system"
+            catalog = f"ds_{dataset}"
+            escaped_path = str(db_path).replace("'", "''")
+            self.control.execute(f"ATTACH '{escaped_path}' AS \"{catalog}\" (READ_ONLY)")
+            self.attached[dataset] = catalog
+            logger.info(f"Attached dataset {dataset} as {catalog}")
 
-    def get_available_datasets(self) -> List[DatasetInfo]:
-        """Get list of available datasets"""
-        datasets = []
-        for db_file in self.data_path.glob("*.duckdb"):
-            try:
-                conn = duckdb.connect(str(db_file))
-                tables = conn.execute("SHOW TABLES").fetchall()
-
-                if tables:
-                    # Get row count for the first table (assuming one main table per DB)
-                    table_name = tables[0][0]
-                    row_count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-
-                    datasets.append(DatasetInfo(
-                        id=db_file.stem,
-                        name=db_file.stem.replace("_", " ").title(),
-                        description=f"Database with {len(tables)} tables",
-                        rowCount=row_count,
-                        path=str(db_file)
-                    ))
-
-                conn.close()
-            except Exception as e:
-                logger.warning(f"Error reading dataset {db_file}: {e}")
+        return self.attached[dataset]
 
-        return datasets
+    def _get_pool(self, dataset: str) -> queue.Queue:
+        """Get or create the cursor pool for a dataset"""
+        pool = self.pools.get(dataset)
+        if pool is not None:
+            return pool
 
-    def get_dataset_fields(self, dataset: str) -> List[PivotField]:
-        """Get available fields for a dataset"""
-        conn = self.get_connection(dataset)
+        with self._pool_lock:
+            if dataset not in self.pools:
+                catalog = self._attach(dataset)
 
-        # Get the first table (assuming one main table per dataset)
-        tables = conn.execute("SHOW TABLES").fetchall()
-        if not tables:
-            raise HTTPException(status_code=404, detail=f"No tables found in dataset {dataset}")
+                # Cursors share the control connection's database instance but
+                # run independently; each defaults to its dataset's catalog
+                pool = queue.Queue(maxsize=self.pool_size)
+                for _ in range(self.pool_size):
+                    cursor = self.control.cursor()
+                    cursor.execute(f'USE "{catalog}"')
+                    pool.put(cursor)
 
-        table_name = tables[0][0]
+                self.pools[dataset] = pool
+                logger.info(f"Created connection pool of {self.pool_size} for dataset: {dataset}")
 
-        # Get column information
-        columns = conn.execute(f"DESCRIBE {table_name}").fetchall()
+            return self.pools[dataset]
 
-        fields = []
-        for col_name, col_type, nullable, *_ in columns:
-            # Map DuckDB types to our types
-            data_type = self._map_duckdb_type(col_type)
+    def _configure_connection(self, conn: duckdb.DuckDBPyConnection):
+        """Apply resource settings to a new database instance.
+
+        Large pivots spill to temp_directory instead of failing at the memory
+        limit; dropping insertion order lets aggregates run fully in parallel.
+        """
+        conn.execute(f"SET threads TO {DUCKDB_THREADS}")
+        conn.execute("SET memory_limit = ?", [DUCKDB_MEMORY_LIMIT])
+        conn.execute("SET temp_directory = ?", [DUCKDB_TEMP_DIR])
+        conn.execute("SET preserve_insertion_order = false")
+
+    @contextmanager
+    def acquire(self, dataset: str):
+        """Borrow a pooled DuckDB cursor for a dataset, returning it on exit"""
+        pool = self._get_pool(dataset)
+        conn = pool.get()
+        try:
+            with self._stale_lock:
+                stale_tables = self._stale_tables.pop(dataset, [])
+            for table in stale_tables:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
 
-            fields.append(PivotField(
-                id=col_name,
-                name=col_name.replace("_", " ").title(),
-                dataType=data_type
+            yield conn
+        finally:
+            pool.put(conn)
+
+    def discard_table(self, dataset: str, table: str):
+        """Schedule a scratch table to be dropped the next time the dataset is used"""
+        with self._stale_lock:
+            self._stale_tables.setdefault(dataset, []).append(table)
+
+    def _get_meta(self, dataset: str) -> DatasetMeta:
+        """Get catalog metadata for a dataset, reloading it when its files change.
+
+        Must not be called while holding a cursor from the same pool.
+        """
+        db_path = self.data_path / f"{dataset}.duckdb"
+        if not db_path.exists():
+            raise HTTPException(status_code=404, detail=f"Dataset {dataset} not found")
+
+        mtime = db_path.stat().st_mtime
+        parquet_path = self.data_path / f"{dataset}.parquet"
+        parquet_mtime = parquet_path.stat().st_mtime if parquet_path.exists() else None
+
+        meta = self._meta_cache.get(dataset)
+        if meta is None or meta.mtime != mtime or meta.parquetMtime != parquet_mtime:
+            with self.acquire(dataset) as conn:
+                # Assume one main table per dataset: the first by name. Read the
+                # same catalog as get_available_datasets, which excludes views.
+                tables = conn.execute("""
+                SELECT table_name
+                FROM duckdb_tables()
+                WHERE database_name = current_database() AND schema_name = 'main'
+                ORDER BY table_name
+                """).fetchall()
+                if not tables:
+                    raise HTTPException(status_code=404, detail=f"No tables found in dataset {dataset}")
+
+                table_name = tables[0][0]
+                columns = conn.execute(f"DESCRIBE {table_name}").fetchall()
+                row_count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+            fields = []
+            for col_name, col_type, nullable, *_ in columns:
+                # Map DuckDB types to our types
+                data_type = self._map_duckdb_type(col_type)
+
+                fields.append(PivotField(
+                    id=col_name,
+                    name=col_name.replace("_", " ").title(),
+                    dataType=data_type
+                ))
+
+            # Scan the optimized Parquet copy unless the database is newer
+            if parquet_mtime is not None and parquet_mtime >= mtime:
+                escaped_path = str(parquet_path).replace("'", "''")
+                source = f"read_parquet('{escaped_path}')"
+            else:
+                source = table_name
+
+            meta = DatasetMeta(
+                tableName=table_name,
+                source=source,
+                tableCount=len(tables),
+                fields=fields,
+                rowCount=row_count,
+                mtime=mtime,
+                parquetMtime=parquet_mtime
+            )
+            self._meta_cache[dataset] = meta
+            logger.info(f"Loaded metadata for dataset: {dataset}")
+
+        return meta
+
+    def get_available_datasets(self) -> List[DatasetInfo]:
+        """Get list of available datasets"""
+        db_files = {}
+        with self._pool_lock:
+            for db_file in self.data_path.glob("*.duckdb"):
+                try:
+                    self._attach(db_file.stem)
+                    db_files[self.attached[db_file.stem]] = db_file
+                except Exception as e:
+                    logger.warning(f"Error reading dataset {db_file}: {e}")
+
+        if not db_files:
+            return []
+
+        # One catalog query covers every dataset. The first table by name is
+        # the main one, as in _get_meta; estimated_size gives its row count
+        # without scanning it.
+        cursor = self.control.cursor()
+        try:
+            catalogs = list(db_files)
+            tables = cursor.execute(f"""
+            SELECT
+                database_name,
+                COUNT(*) AS table_count,
+                arg_min(estimated_size, table_name) AS row_count
+            FROM duckdb_tables()
+            WHERE schema_name = 'main'
+              AND database_name IN ({', '.join('?' for _ in catalogs)})
+            GROUP BY database_name
+            """, catalogs).fetchall()
+        finally:
+            cursor.close()
+
+        datasets = []
+        for catalog, table_count, row_count in sorted(tables):
+            db_file = db_files[catalog]
+            datasets.append(DatasetInfo(
+                id=db_file.stem,
+                name=db_file.stem.replace("_", " ").title(),
+                description=f"Database with {table_count} tables",
+                rowCount=row_count,
+                path=str(db_file)
             ))
 
-        return fields
+        return datasets
+
+    def get_dataset_fields(self, dataset: str) -> List[PivotField]:
+        """Get available fields for a dataset"""
+        return list(self._get_meta(dataset).fields)
 
     def get_field_values(self, dataset: str, field_id: str, limit: int = 100) -> List[Any]:
-        """Get unique values for a field (for filtering)"""
-        conn = self.get_connection(dataset)
-
-        # Get the first table
-        tables = conn.execute("SHOW TABLES").fetchall()
-        table_name = tables[0][0]
+        """Get the most frequent values of a field (for filtering), sorted.
 
-        # Get unique values
+        Large tables are counted over a seeded Bernoulli sample instead of a
+        full scan, so repeated calls return the same values. When the sample
+        would hold fewer than ten rows per requested value, the exact counts
+        are used instead.
+        """
+        meta = self._get_meta(dataset)
+        if field_id not in {field.id for field in meta.fields}:
+            raise HTTPException(status_code=404, detail=f"Field {field_id} not found in dataset {dataset}")
+
+        source = meta.source
+        sample_rows = meta.rowCount * FIELD_VALUES_SAMPLE_PERCENT / 100
+        if sample_rows >= 10 * limit:
+            source = f"""(
+                SELECT "{field_id}"
+                FROM {meta.source}
+                USING SAMPLE bernoulli({FIELD_VALUES_SAMPLE_PERCENT} PERCENT) REPEATABLE ({FIELD_VALUES_SAMPLE_SEED})
+            )"""
+
+        # Top-k by frequency only needs a bounded heap, not a full sort
         query = f"""
-        SELECT DISTINCT "{field_id}"
-        FROM {table_name}
-        WHERE "{field_id}" IS NOT NULL
-        ORDER BY "{field_id}"
-        LIMIT {limit}
+        SELECT "{field_id}"
+        FROM (
+            SELECT "{field_id}", COUNT(*) AS frequency
+            FROM {source}
+            WHERE "{field_id}" IS NOT NULL
+            GROUP BY "{field_id}"
+            ORDER BY frequency DESC, 1
+            LIMIT {limit}
+        )
+        ORDER BY 1
         """
 
-        result = conn.execute(query).fetchall()
+        with self.acquire(dataset) as conn:
+            result = conn.execute(query).fetchall()
         return [row[0] for row in result]
 
-    def compute_pivot(self, request: PivotRequest) -> PivotResponse:
-        """Compute pivot table using DuckDB PIVOT functionality"""
-        start_time = datetime.now()
+    def optimize_dataset(self, dataset: str, order_by: Optional[str] = None) -> Dict[str, Any]:
+        """Write a clustered Parquet copy of a dataset for pivots to scan.
 
-        try:
-            conn = self.get_connection(request.dataset)
+        Rows are sorted by ``order_by`` (default: the first date field, else
+        the first string field) so each row group covers a narrow value range
+        and its min/max statistics let DuckDB skip row groups when filtering.
+        """
+        meta = self._get_meta(dataset)
+        field_ids = [field.id for field in meta.fields]
+
+        if order_by is None:
+            for data_type in ('date', 'string'):
+                order_by = next((field.id for field in meta.fields if field.dataType == data_type), None)
+                if order_by:
+                    break
+        elif order_by not in field_ids:
+            raise HTTPException(status_code=400, detail=f"Unknown field {order_by} in dataset {dataset}")
+
+        order_clause = f'ORDER BY "{order_by}"' if order_by else ""
+        parquet_path = self.data_path / f"{dataset}.parquet"
+        tmp_path = parquet_path.with_suffix(".parquet.tmp")
+        escaped_path = str(tmp_path).replace("'", "''")
 
-            # Get the main table name
-            tables = conn.execute("SHOW TABLES").fetchall()
-            table_name = tables[0][0]
+        start_time = datetime.now()
+        with self.acquire(dataset) as conn:
+            conn.execute(f"""
+            COPY (SELECT * FROM {meta.tableName} {order_clause})
+            TO '{escaped_path}' (FORMAT PARQUET, ROW_GROUP_SIZE {PARQUET_ROW_GROUP_SIZE})
+            """)
 
-            # Build the pivot query
-            pivot_query = self._build_pivot_query(table_name, request.configuration)
+        # Swap in atomically so concurrent pivots never read a partial file
+        os.replace(tmp_path, parquet_path)
+        logger.info(f"Optimized dataset {dataset} into {parquet_path} ordered by {order_by}")
 
-            logger.info(f"Executing pivot query: {pivot_query}")
+        return {
+            'dataset': dataset,
+            'path': str(parquet_path),
+            'orderBy': order_by,
+            'rowCount': meta.rowCount,
+            'computationTime': (datetime.now() - start_time).total_seconds() * 1000
+        }
 
-            # Execute the query
-            result = conn.execute(pivot_query).fetchdf()
+    def compute_pivot(self, request: PivotRequest) -> PivotResponse:
+        """Compute pivot table using DuckDB PIVOT functionality"""
+        start_time = datetime.now()
+
+        try:
+            result, cache_key = self._run_pivot(request)
 
             # Convert result to our pivot structure
             structure = self._convert_to_pivot_structure(result, request.configuration)
 
             computation_time = (datetime.now() - start_time).total_seconds() * 1000
-            cache_key = self._generate_cache_key(request)
-
-            # Cache the result
-            pivot_cache[cache_key] = {
-                'structure': structure,
-                'timestamp': datetime.now(),
-                'request': request
-            }
 
             response = PivotResponse(
                 structure=structure,
@@ -297,57 +605,292 @@ class DuckDBPivotService:
             logger.error(f"Error computing pivot: {e}")
             raise HTTPException(status_code=500, detail=f"Pivot computation failed: {str(e)}")
 
-    def _build_pivot_query(self, table_name: str, config: PivotConfiguration) -> str:
-        """Build DuckDB PIVOT query from configuration"""
+    def compute_pivot_columnar(self, request: PivotRequest) -> Dict[str, Any]:
+        """Compute pivot table as a column-major PivotColumnarResponse payload.
+
+        Returns plain lists rather than models so the response can be encoded
+        by orjson directly, without per-cell Pydantic objects.
+        """
+        start_time = datetime.now()
+
+        try:
+            result, cache_key = self._run_pivot(request)
+
+            columns = [str(col_name) for col_name in result.columns]
+            structure = {
+                'columns': columns,
+                'values': [self._column_values(result[col_name]) for col_name in result.columns],
+                'formatted': [self._format_column(result[col_name]) for col_name in result.columns],
+                'rowCount': len(result),
+                'columnCount': len(columns),
+                'totalRows': len(result),
+                'totalColumns': len(columns)
+            }
+
+            return {
+                'structure': structure,
+                'metadata': {
+                    'totalDataRows': len(result),
+                    'computationTime': (datetime.now() - start_time).total_seconds() * 1000,
+                    'cacheKey': cache_key,
+                    'timestamp': int(datetime.now().timestamp())
+                },
+                'hasMore': False,
+                'error': None
+            }
+
+        except Exception as e:
+            logger.error(f"Error computing pivot: {e}")
+            raise HTTPException(status_code=500, detail=f"Pivot computation failed: {str(e)}")
+
+    def _run_pivot(self, request: PivotRequest) -> Tuple[pd.DataFrame, str]:
+        """Run the pivot query and cache the request for drill-downs.
+
+        Returns the raw result frame and its cache key.
+        """
+        table_name = self._get_meta(request.dataset).source
+        cache_key = self._generate_cache_key(request)
+
+        with self.acquire(request.dataset) as conn:
+            # Build the pivot query
+            pivot_query, params, pivot_values = self._build_pivot_query(conn, table_name, request.configuration)
+
+            logger.info(f"Executing pivot query: {pivot_query} with params {params}")
+
+            # Execute the query
+            result = conn.execute(pivot_query, params).fetchdf()
+
+        self._cache_request(cache_key, request, pivot_values)
+
+        return result, cache_key
+
+    def _stream_pivot(self, request: PivotRequest) -> Tuple[str, pa.RecordBatchReader, ExitStack]:
+        """Start a pivot query whose result is read one record batch at a time.
+
+        Returns the cache key, the batch reader and an ExitStack holding the
+        borrowed cursor; closing the stack returns the cursor to its pool.
+        """
+        table_name = self._get_meta(request.dataset).source
+        cache_key = self._generate_cache_key(request)
+
+        stack = ExitStack()
+        try:
+            conn = stack.enter_context(self.acquire(request.dataset))
+
+            pivot_query, params, pivot_values = self._build_pivot_query(conn, table_name, request.configuration)
+
+            logger.info(f"Executing pivot query (streaming): {pivot_query} with params {params}")
+
+            reader = conn.execute(pivot_query, params).fetch_record_batch(STREAM_BATCH_ROWS)
+        except Exception:
+            stack.close()
+            raise
+
+        self._cache_request(cache_key, request, pivot_values)
+
+        return cache_key, reader, stack
+
+    def _materialize_rollup(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        cache_key: str,
+        cached_data: Dict[str, Any],
+        rollup_table: str
+    ) -> bool:
+        """Pre-aggregate every row level of a cached request so drill-downs only
+        read their subtree.
+
+        Returns whether the table was registered on the cache entry. It is not
+        if the entry was evicted or another drill registered a rollup first;
+        the caller then drops the table once it has been read.
+        """
+        rollup_query, rollup_params = self._build_rollup_query(
+            table_name, cached_data['request'].configuration, rollup_table, cached_data['pivotValues']
+        )
+        conn.execute(rollup_query, rollup_params)
+
+        with pivot_cache_lock:
+            registered = pivot_cache.get(cache_key) is cached_data and cached_data['rollupTable'] is None
+            if registered:
+                cached_data['rollupTable'] = rollup_table
+        return registered
+
+    def _cache_request(self, cache_key: str, request: PivotRequest, pivot_values: Optional[List[List[Any]]]):
+        """Cache a computed request and its pivot values for drill-downs.
+
+        Overwriting an entry bypasses the cache's eviction hook, so a rollup
+        built for the replaced entry is carried over rather than leaked; the
+        key covers everything the rollup depends on.
+        """
+        with pivot_cache_lock:
+            replaced = pivot_cache.get(cache_key)
+            pivot_cache[cache_key] = {
+                'timestamp': datetime.now(),
+                'request': request,
+                'pivotValues': pivot_values,
+                'rollupTable': replaced['rollupTable'] if replaced else None
+            }
+
+    def compute_drill(self, request: PivotDrillRequest, cached_data: Dict[str, Any]) -> PivotResponse:
+        """Compute the subtree under a drill path from the request's rollup table.
+
+        The rollup is built by the first drill on a cached request, so pivots
+        that are never drilled into do not pay for it. Expanding returns the
+        path's children; collapsing returns the path's own aggregate row.
+        Raises duckdb.CatalogException if the rollup table has already been
+        dropped.
+        """
+        start_time = datetime.now()
+        original_request = cached_data['request']
+        table_name = self._get_meta(original_request.dataset).source
+
+        rollup_table = cached_data['rollupTable']
+        build_rollup = rollup_table is None
+        if build_rollup:
+            rollup_table = f'{ROLLUP_SCHEMA}."pivot_agg_{request.cacheKey}_{uuid.uuid4().hex[:8]}"'
+
+        drill_query, params = self._build_drill_query(
+            original_request.configuration, rollup_table, cached_data['pivotValues'],
+            request.path, request.action
+        )
+
+        with self.acquire(original_request.dataset) as conn:
+            registered = True
+            if build_rollup:
+                registered = self._materialize_rollup(conn, table_name, request.cacheKey, cached_data, rollup_table)
+
+            logger.info(f"Executing drill query: {drill_query} with params {params}")
+
+            result = conn.execute(drill_query, params).fetchdf()
+
+            if not registered:
+                conn.execute(f"DROP TABLE IF EXISTS {rollup_table}")
+
+        structure = self._convert_to_pivot_structure(result, original_request.configuration)
+
+        return PivotResponse(
+            structure=structure,
+            metadata={
+                'totalDataRows': len(result),
+                'computationTime': (datetime.now() - start_time).total_seconds() * 1000,
+                'cacheKey': request.cacheKey,
+                'path': request.path,
+                'action': request.action,
+                'timestamp': int(datetime.now().timestamp())
+            }
+        )
+
+    def compute_pivot_arrow(self, request: PivotRequest) -> Tuple[str, Iterator[bytes]]:
+        """Compute pivot table and stream it as Arrow IPC, one record batch at a time.
+
+        Returns the cache key and the stream.
+        """
+        cache_key, reader, stack = self._stream_pivot(request)
+
+        def generate() -> Iterator[bytes]:
+            with stack:
+                sink = io.BytesIO()
+                with pa.ipc.new_stream(sink, reader.schema) as writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+                        yield self._drain(sink)
+                # End-of-stream marker written on close
+                yield self._drain(sink)
+
+        return cache_key, generate()
+
+    def compute_pivot_ndjson(self, request: PivotRequest) -> Tuple[str, Iterator[bytes]]:
+        """Compute pivot table and stream it as newline-delimited JSON rows.
+
+        Rows are objects keyed by column name. Only one record batch is held
+        in memory at a time. Returns the cache key and the stream.
+        """
+        cache_key, reader, stack = self._stream_pivot(request)
+
+        def generate() -> Iterator[bytes]:
+            with stack:
+                for batch in reader:
+                    yield b"".join(
+                        orjson.dumps(row, default=_orjson_default, option=orjson.OPT_APPEND_NEWLINE)
+                        for row in batch.to_pylist()
+                    )
+
+        return cache_key, generate()
+
+    @staticmethod
+    def _drain(sink: io.BytesIO) -> bytes:
+        """Return and clear the bytes buffered in a sink"""
+        chunk = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return chunk
+
+    def _build_pivot_query(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        table_name: str,
+        config: PivotConfiguration
+    ) -> Tuple[str, List[Any], Optional[List[List[Any]]]]:
+        """Build parameterized DuckDB PIVOT query from configuration.
+
+        Filter values are bound as ``?`` parameters rather than interpolated,
+        so the query text only depends on the configuration shape. Also
+        returns the values picked for each column dimension, or None if there
+        are none to pivot on.
+        """
+        pivot_values = None
+        params: List[Any] = []
 
         # Start with base table
         query_parts = [f"FROM {table_name}"]
 
         # Apply filters
-        if config.filters:
-            where_clauses = []
-            for filter_item in config.filters:
-                if filter_item.enabled:
-                    clause = self._build_filter_clause(filter_item)
-                    if clause:
-                        where_clauses.append(clause)
-
-            if where_clauses:
-                query_parts.append(f"WHERE {' AND '.join(where_clauses)}")
+        where_clause = self._build_where_clause(config, params)
+        if where_clause:
+            query_parts.append(where_clause)
 
         # Build PIVOT operation
         if config.columns:
-            # Use DuckDB's PIVOT syntax
-            pivot_columns = [f'"{col.id}"' for col in config.columns]
+            # Use DuckDB's PIVOT syntax. A PIVOT whose source takes parameters
+            # needs its pivot values spelled out, so look them up first.
+            source = ' '.join(query_parts)
+            pivot_values = self._pick_pivot_values(conn, source, params, config)
+
+            if pivot_values is None:
+                # No column values to pivot on, e.g. the filters matched no rows
+                pivot_query = self._build_rows_only_query(config, source)
+            else:
+                on_clause, pivot_params = self._build_pivot_on_clause(config, pivot_values)
 
-            # Build aggregation expressions
-            if config.values:
-                aggregations = []
-                for value_field in config.values:
-                    agg_func = self._map_aggregation(value_field.aggregation)
-                    field_name = f'"{value_field.field.id}"'
-                    aggregations.append(f'{agg_func}({field_name}) AS {value_field.displayName or value_field.field.name}')
+                # Build aggregation expressions
+                if config.values:
+                    aggregations = []
+                    for value_field in config.values:
+                        alias = value_field.displayName or value_field.field.name
+                        aggregations.append(f'{self._build_aggregation(value_field)} AS "{alias}"')
 
-                using_clause = f"USING {', '.join(aggregations)}"
-            else:
-                using_clause = "USING count(*)"
+                    using_clause = f"USING {', '.join(aggregations)}"
+                else:
+                    using_clause = "USING count(*)"
 
-            # Build GROUP BY clause
-            if config.rows:
-                group_by_columns = [f'"{row.id}"' for row in config.rows]
-                group_by_clause = f"GROUP BY {', '.join(group_by_columns)}"
-            else:
-                group_by_clause = ""
+                # Build GROUP BY clause
+                if config.rows:
+                    group_by_columns = [f'"{row.id}"' for row in config.rows]
+                    group_by_clause = f"GROUP BY {', '.join(group_by_columns)}"
+                else:
+                    group_by_clause = ""
 
-            # Construct the full PIVOT query
-            base_query = f"SELECT * {' '.join(query_parts)}"
+                # Construct the full PIVOT query
+                base_query = f"SELECT {', '.join(self._projected_columns(config))} {' '.join(query_parts)}"
 
-            pivot_query = f"""
-            PIVOT ({base_query})
-            ON {', '.join(pivot_columns)}
-            {using_clause}
-            {group_by_clause}
-            """
+                pivot_query = f"""
+                PIVOT ({base_query})
+                {on_clause}
+                {using_clause}
+                {group_by_clause}
+                """
+                params = params + pivot_params
         else:
             # No pivot, just aggregation
             if config.values:
@@ -359,10 +902,8 @@ class DuckDBPivotService:
 
                 # Add aggregations
                 for value_field in config.values:
-                    agg_func = self._map_aggregation(value_field.aggregation)
-                    field_name = f'"{value_field.field.id}"'
                     alias = value_field.displayName or value_field.field.name
-                    select_parts.append(f'{agg_func}({field_name}) AS "{alias}"')
+                    select_parts.append(f'{self._build_aggregation(value_field)} AS "{alias}"')
 
                 select_clause = f"SELECT {', '.join(select_parts)}"
 
@@ -382,40 +923,284 @@ class DuckDBPivotService:
         if config.maxRows:
             pivot_query += f" LIMIT {config.maxRows}"
 
-        return pivot_query
+        return pivot_query, params, pivot_values
+
+    def _projected_columns(self, config: PivotConfiguration) -> List[str]:
+        """Quoted columns a pivot reads: its row, column and value fields.
+
+        Filters are applied in the same SELECT, so their fields need not be
+        projected.
+        """
+        field_ids = [row.id for row in config.rows]
+        field_ids += [col.id for col in config.columns]
+        field_ids += [value_field.field.id for value_field in config.values]
+        return [f'"{field_id}"' for field_id in dict.fromkeys(field_ids)]
+
+    def _supports_rollup(self, config: PivotConfiguration) -> bool:
+        """Whether drill-downs on this configuration can be served from a rollup table"""
+        return len(config.rows) > 1 and bool(config.values or config.columns)
+
+    def _build_rollup_query(
+        self,
+        table_name: str,
+        config: PivotConfiguration,
+        rollup_table: str,
+        pivot_values: Optional[List[List[Any]]]
+    ) -> Tuple[str, List[Any]]:
+        """Build the query materializing a ROLLUP over the row dimensions.
+
+        Column dimensions are kept as plain grouping keys, restricted to the
+        pivot's own values, and measures are stored as __m0, __m1, ... so
+        every drill path's subtree, at any level, is a filtered read of this
+        table.
+        """
+        params: List[Any] = []
+        where_clause = self._build_where_clause(config, params)
+
+        row_columns = [f'"{row.id}"' for row in config.rows]
+        column_columns = []
+
+        # Without pivot values the drill reads row groups only
+        if pivot_values is not None:
+            column_columns = [f'"{col.id}"' for col in config.columns]
+            value_clauses = []
+            for col, values in zip(config.columns, pivot_values):
+                placeholders = ', '.join('?' for _ in values)
+                value_clauses.append(f'"{col.id}" IN ({placeholders})')
+                params.extend(values)
+            prefix = f"{where_clause} AND" if where_clause else "WHERE"
+            where_clause = f"{prefix} {' AND '.join(value_clauses)}"
+
+        if config.values:
+            measures = [self._build_aggregation(value_field) for value_field in config.values]
+        else:
+            measures = ["COUNT(*)"]
+
+        select_parts = row_columns + column_columns + [
+            f'{measure} AS "__m{i}"' for i, measure in enumerate(measures)
+        ]
+        select_parts.append(f"GROUPING({', '.join(row_columns)}) AS {ROLLUP_LEVEL_COLUMN}")
+
+        group_by_parts = [f"ROLLUP({', '.join(row_columns)})"] + column_columns
+
+        query = f"""
+        CREATE TABLE {rollup_table} AS
+        SELECT {', '.join(select_parts)}
+        FROM {table_name}
+        {where_clause}
+        GROUP BY {', '.join(group_by_parts)}
+        """
+
+        return query, params
+
+    def _build_drill_query(
+        self,
+        config: PivotConfiguration,
+        rollup_table: str,
+        pivot_values: Optional[List[List[Any]]],
+        path: List[str],
+        action: str
+    ) -> Tuple[str, List[Any]]:
+        """Build the query reading one drill path's subtree from a rollup table.
 
-    def _build_filter_clause(self, filter_item: PivotFilter) -> str:
-        """Build WHERE clause for a filter"""
+        Pivots on the values the full pivot picked, so drilled rows line up
+        with its columns.
+        """
+        depth = len(path) + 1 if action == "expand" else len(path)
+        if len(path) > len(config.rows) or depth > len(config.rows):
+            raise HTTPException(status_code=400, detail=f"Cannot {action} path {path}: too deep")
+
+        # GROUPING() sets one bit per rolled-up row dimension, last dimension lowest
+        params: List[Any] = list(path)
+        where_clauses = [f'"{row.id}" = ?' for row in config.rows[:len(path)]]
+        where_clauses.append(f"{ROLLUP_LEVEL_COLUMN} = {(1 << (len(config.rows) - depth)) - 1}")
+        source = f"FROM {rollup_table} WHERE {' AND '.join(where_clauses)}"
+
+        row_columns = [f'"{row.id}"' for row in config.rows]
+        column_columns = [f'"{col.id}"' for col in config.columns]
+        measure_columns = [f'"__m{i}"' for i in range(max(len(config.values), 1))]
+
+        if config.columns and pivot_values is None:
+            drill_query = self._build_rows_only_query(config, source)
+        elif config.columns:
+            on_clause, pivot_params = self._build_pivot_on_clause(config, pivot_values)
+            params.extend(pivot_params)
+
+            # Each (row, column) group holds exactly one pre-aggregated row.
+            # Missing groups count as 0, as they do in the full pivot.
+            if config.values:
+                aggregations = []
+                for i, value_field in enumerate(config.values):
+                    measure = f'FIRST("__m{i}")'
+                    if value_field.aggregation in ('count', 'countDistinct'):
+                        measure = f'COALESCE({measure}, 0)'
+                    aggregations.append(f'{measure} AS "{value_field.displayName or value_field.field.name}"')
+            else:
+                aggregations = ['COALESCE(FIRST("__m0"), 0)']
+
+            drill_query = f"""
+            PIVOT (SELECT {', '.join(row_columns + column_columns + measure_columns)} {source})
+            {on_clause}
+            USING {', '.join(aggregations)}
+            GROUP BY {', '.join(row_columns)}
+            """
+        else:
+            measures = [
+                f'"__m{i}" AS "{value_field.displayName or value_field.field.name}"'
+                for i, value_field in enumerate(config.values)
+            ]
+            drill_query = f"SELECT {', '.join(row_columns + measures)} {source}"
+
+        if config.maxRows:
+            drill_query += f" LIMIT {config.maxRows}"
+
+        return drill_query, params
+
+    def _pick_pivot_values(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        source: str,
+        params: List[Any],
+        config: PivotConfiguration
+    ) -> Optional[List[List[Any]]]:
+        """Pick each column dimension's pivot values, or None if some dimension has none
+
+        The maxColumns budget is split across dimensions: each keeps its top
+        floor(maxColumns ** (1 / len(columns))) values, so the combined
+        column tuples stay within maxColumns.
+        """
+        limit = self._per_dimension_limit(config.maxColumns or MAX_COLUMNS_PER_QUERY, len(config.columns))
+        pivot_values = []
+        for col in config.columns:
+            values = self._get_pivot_values(conn, source, params, col, limit)
+            if not values:
+                return None
+            pivot_values.append(values)
+        return pivot_values
+
+    @staticmethod
+    def _per_dimension_limit(max_columns: int, dimensions: int) -> int:
+        """Largest k >= 1 with k ** dimensions <= max_columns"""
+        limit = max(1, int(round(max_columns ** (1 / dimensions))))
+        while limit > 1 and limit ** dimensions > max_columns:
+            limit -= 1
+        while (limit + 1) ** dimensions <= max_columns:
+            limit += 1
+        return limit
+
+    def _build_pivot_on_clause(
+        self,
+        config: PivotConfiguration,
+        pivot_values: List[List[Any]]
+    ) -> Tuple[str, List[Any]]:
+        """Build the PIVOT ON clause listing each column dimension's values, with its parameters"""
+        pivot_columns = []
+        pivot_params: List[Any] = []
+        for col, values in zip(config.columns, pivot_values):
+            placeholders = ', '.join('?' for _ in values)
+            pivot_columns.append(f'"{col.id}" IN ({placeholders})')
+            pivot_params.extend(values)
+
+        return f"ON {', '.join(pivot_columns)}", pivot_params
+
+    def _build_rows_only_query(self, config: PivotConfiguration, source: str) -> str:
+        """Build the query for a pivot with no column values: its row groups alone.
+
+        Without row dimensions either, the result is empty.
+        """
+        if not config.rows:
+            return f"SELECT * FROM (SELECT {', '.join(self._projected_columns(config))} {source}) WHERE FALSE"
+
+        row_columns = [f'"{row.id}"' for row in config.rows]
+        return f"SELECT {', '.join(row_columns)} {source} GROUP BY {', '.join(row_columns)}"
+
+    def _get_pivot_values(
+        self,
+        conn: duckdb.DuckDBPyConnection,
+        source: str,
+        params: List[Any],
+        column: PivotField,
+        limit: int
+    ) -> List[Any]:
+        """Get the most frequent values of a column dimension for the PIVOT ... IN list.
+
+        Capping the list up front keeps high-cardinality dimensions from
+        producing thousands of pivot columns; the values are returned sorted.
+        """
+        query = f"""
+        SELECT "{column.id}"
+        FROM (
+            SELECT "{column.id}", COUNT(*) AS frequency
+            {source}
+            GROUP BY "{column.id}"
+            HAVING "{column.id}" IS NOT NULL
+            ORDER BY frequency DESC, 1
+            LIMIT {limit}
+        )
+        ORDER BY 1
+        """
+        return [row[0] for row in conn.execute(query, params).fetchall()]
+
+    def _build_where_clause(self, config: PivotConfiguration, params: List[Any]) -> str:
+        """Build the WHERE clause for all enabled filters, or "" if there are none"""
+        where_clauses = []
+        for filter_item in config.filters:
+            if filter_item.enabled:
+                clause = self._build_filter_clause(filter_item, params)
+                if clause:
+                    where_clauses.append(clause)
+
+        return f"WHERE {' AND '.join(where_clauses)}" if where_clauses else ""
+
+    def _build_filter_clause(self, filter_item: PivotFilter, params: List[Any]) -> str:
+        """Build WHERE clause for a filter, appending its bound values to params.
+
+        Values that were previously quoted as string literals are bound as
+        strings so DuckDB casts them to the column type the same way.
+        """
         field_name = f'"{filter_item.field.id}"'
         operator = filter_item.operator
         value = filter_item.value
 
         if operator == "equals":
-            return f"{field_name} = '{value}'"
+            params.append(str(value))
+            return f"{field_name} = ?"
         elif operator == "notEquals":
-            return f"{field_name} != '{value}'"
+            params.append(str(value))
+            return f"{field_name} != ?"
         elif operator == "contains":
-            return f"{field_name} LIKE '%{value}%'"
+            params.append(f"%{value}%")
+            return f"{field_name} LIKE ?"
         elif operator == "notContains":
-            return f"{field_name} NOT LIKE '%{value}%'"
+            params.append(f"%{value}%")
+            return f"{field_name} NOT LIKE ?"
         elif operator == "greaterThan":
-            return f"{field_name} > {value}"
+            params.append(value)
+            return f"{field_name} > ?"
         elif operator == "lessThan":
-            return f"{field_name} < {value}"
+            params.append(value)
+            return f"{field_name} < ?"
         elif operator == "greaterThanOrEqual":
-            return f"{field_name} >= {value}"
+            params.append(value)
+            return f"{field_name} >= ?"
         elif operator == "lessThanOrEqual":
-            return f"{field_name} <= {value}"
+            params.append(value)
+            return f"{field_name} <= ?"
         elif operator == "in" and isinstance(value, list):
-            values = "', '".join(str(v) for v in value)
-            return f"{field_name} IN ('{values}')"
+            if not value:
+                return "FALSE"
+            params.extend(str(v) for v in value)
+            return f"{field_name} IN ({', '.join('?' for _ in value)})"
         elif operator == "notIn" and isinstance(value, list):
-            values = "', '".join(str(v) for v in value)
-            return f"{field_name} NOT IN ('{values}')"
+            if not value:
+                return ""
+            params.extend(str(v) for v in value)
+            return f"{field_name} NOT IN ({', '.join('?' for _ in value)})"
         elif operator == "between" and isinstance(value, dict):
-            return f"{field_name} BETWEEN {value.get('min')} AND {value.get('max')}"
+            params.extend([value.get('min'), value.get('max')])
+            return f"{field_name} BETWEEN ? AND ?"
         elif operator == "isEmpty":
-            return f"{field_name} IS NULL OR {field_name} = ''"
+            return f"({field_name} IS NULL OR {field_name} = '')"
         elif operator == "isNotEmpty":
             return f"{field_name} IS NOT NULL AND {field_name} != ''"
 
@@ -437,6 +1222,14 @@ class DuckDBPivotService:
 
         return mapping.get(aggregation, 'COUNT')
 
+    def _build_aggregation(self, value_field: PivotValueField) -> str:
+        """Build the aggregate expression for a value field"""
+        field_name = f'"{value_field.field.id}"'
+        if value_field.aggregation == 'countDistinct':
+            return f"COUNT(DISTINCT {field_name})"
+
+        return f"{self._map_aggregation(value_field.aggregation)}({field_name})"
+
     def _map_duckdb_type(self, duckdb_type: str) -> str:
         """Map DuckDB data types to our field types"""
         duckdb_type = duckdb_type.upper()
@@ -453,18 +1246,20 @@ class DuckDBPivotService:
     def _convert_to_pivot_structure(self, df: pd.DataFrame, config: PivotConfiguration) -> PivotStructure:
         """Convert pandas DataFrame to our PivotStructure format"""
 
-        # Simple conversion for now - in a full implementation this would be more sophisticated
-        matrix = []
-        for _, row in df.iterrows():
-            cell_row = []
-            for col_name, value in row.items():
-                cell = PivotCell(
-                    value=value,
-                    formattedValue=str(value) if value is not None else "",
-                    type="data"
-                )
-                cell_row.append(cell)
-            matrix.append(cell_row)
+        # Work column-wise: format each column in one vectorized pass, then
+        # zip the columns into rows. Cells are built with model_construct since
+        # the values come straight from DuckDB and need no re-validation.
+        values = [self._column_values(df[col_name]) for col_name in df.columns]
+        formatted = [self._format_column(df[col_name]) for col_name in df.columns]
+
+        construct_cell = PivotCell.model_construct
+        matrix = [
+            [
+                construct_cell(value=value, formattedValue=formatted_value, type="data")
+                for value, formatted_value in zip(row_values, row_formatted)
+            ]
+            for row_values, row_formatted in zip(zip(*values), zip(*formatted))
+        ]
 
         # Create basic headers
         column_headers = [[]]
@@ -489,16 +1284,38 @@ class DuckDBPivotService:
             totalColumns=len(matrix[0]) if matrix else 0
         )
 
+    @staticmethod
+    def _column_values(column: pd.Series) -> List[Any]:
+        """Result column values as Python objects, with pd.NA and NaT as None.
+
+        Nullable columns (such as Int64 counts) hold pd.NA, which neither
+        Pydantic nor orjson can serialize.
+        """
+        values = column.tolist()
+        if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'iufb':
+            return values
+        return [None if value is pd.NA or value is pd.NaT else value for value in values]
+
+    def _format_column(self, column: pd.Series) -> List[str]:
+        """Format a result column as display strings, with nulls as empty strings"""
+        # str() per value beats Series.astype(str) plus a null mask, and keeps
+        # the same text as formatting each cell on its own (timestamps
+        # included). NaN and NaT are the values not equal to themselves.
+        return [
+            "" if value is None or value is pd.NA or value != value else str(value)
+            for value in column.tolist()
+        ]
+
     def _generate_cache_key(self, request: PivotRequest) -> str:
         """Generate cache key for a pivot request"""
-        # Create a hash of the request parameters
-        request_str = json.dumps({
-            'dataset': request.dataset,
-            'configuration': request.configuration.dict(),
-            'expandedPaths': request.expandedPaths
-        }, sort_keys=True)
+        # Hash the repr of a flat tuple: no intermediate dicts, no key sorting
+        payload = repr((
+            request.dataset,
+            request.configuration._canonical(),
+            tuple(map(tuple, request.expandedPaths))
+        ))
 
-        return hashlib.md5(request_str.encode()).hexdigest()
+        return xxhash.xxh3_64_hexdigest(payload.encode())
 
 # Initialize the service
 pivot_service = DuckDBPivotService(DATA_BASE_PATH)
@@ -529,9 +1346,12 @@ async def health_check():
         "uptime": int(datetime.now().timestamp())
     }
 
+# DuckDB has no async API: endpoints that query it are plain `def` so FastAPI
+# runs them in its threadpool instead of blocking the event loop
+
 # Get available datasets
 @app.get("/datasets", response_model=List[DatasetInfo])
-async def get_datasets():
+def get_datasets():
     """Get list of available datasets"""
     try:
         return pivot_service.get_available_datasets()
@@ -540,7 +1360,7 @@ async def get_datasets():
 
 # Get fields for a dataset
 @app.get("/datasets/{dataset}/fields", response_model=List[PivotField])
-async def get_dataset_fields(dataset: str):
+def get_dataset_fields(dataset: str):
     """Get available fields for a dataset"""
     try:
         return pivot_service.get_dataset_fields(dataset)
@@ -549,16 +1369,27 @@ async def get_dataset_fields(dataset: str):
 
 # Get field values for filtering
 @app.get("/datasets/{dataset}/fields/{field_id}/values")
-async def get_field_values(dataset: str, field_id: str, limit: int = 100):
+def get_field_values(dataset: str, field_id: str, limit: int = 100):
     """Get unique values for a field"""
     try:
         return pivot_service.get_field_values(dataset, field_id, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Compute pivot table
-@app.post("/pivot/compute", response_model=PivotResponse)
-async def compute_pivot(request: PivotRequest):
+# Write a clustered Parquet copy of a dataset
+@app.post("/datasets/{dataset}/optimize")
+def optimize_dataset(dataset: str, orderBy: Optional[str] = None):
+    """Optimize a dataset for pivot scans"""
+    try:
+        return pivot_service.optimize_dataset(dataset, orderBy)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Compute pivot table (JSON matrix, kept for existing clients)
+@app.post("/pivot/compute", response_model=PivotResponse, deprecated=True)
+def compute_pivot(request: PivotRequest):
     """Compute pivot table"""
     try:
         return pivot_service.compute_pivot(request)
@@ -566,16 +1397,60 @@ async def compute_pivot(request: PivotRequest):
         logger.error(f"Error in compute_pivot: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Compute pivot table as column-major lists, encoded with orjson
+@app.post("/pivot/compute_columnar", response_model=PivotColumnarResponse, response_class=PivotJSONResponse)
+def compute_pivot_columnar(request: PivotRequest):
+    """Compute pivot table in column-major (structure-of-arrays) layout"""
+    try:
+        return PivotJSONResponse(pivot_service.compute_pivot_columnar(request))
+    except Exception as e:
+        logger.error(f"Error in compute_pivot_columnar: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Compute pivot table as an Arrow IPC stream
+@app.post("/pivot/compute_arrow")
+def compute_pivot_arrow(request: PivotRequest):
+    """Compute pivot table and stream the result as Arrow record batches"""
+    try:
+        cache_key, stream = pivot_service.compute_pivot_arrow(request)
+    except Exception as e:
+        logger.error(f"Error in compute_pivot_arrow: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        stream,
+        media_type=ARROW_STREAM_MEDIA_TYPE,
+        headers={CACHE_KEY_HEADER: cache_key}
+    )
+
+# Compute pivot table as a stream of newline-delimited JSON rows
+@app.post("/pivot/compute_stream")
+def compute_pivot_stream(request: PivotRequest):
+    """Compute pivot table and stream the result row by row as ND-JSON"""
+    try:
+        cache_key, stream = pivot_service.compute_pivot_ndjson(request)
+    except Exception as e:
+        logger.error(f"Error in compute_pivot_stream: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return StreamingResponse(
+        stream,
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={CACHE_KEY_HEADER: cache_key}
+    )
+
 # Drill down operation
 @app.post("/pivot/drill", response_model=PivotResponse)
-async def drill_down(request: PivotDrillRequest):
+def drill_down(request: PivotDrillRequest):
     """Perform drill-down operation"""
     try:
         # Get cached result
-        if request.cacheKey not in pivot_cache:
+        with pivot_cache_lock:
+            cached_data = pivot_cache.get(request.cacheKey)
+
+        if cached_data is None:
             raise HTTPException(status_code=404, detail="Cache key not found")
 
-        cached_data = pivot_cache[request.cacheKey]
         original_request = cached_data['request']
 
         # Update expanded paths based on drill request
@@ -586,15 +1461,24 @@ async def drill_down(request: PivotDrillRequest):
             if request.path in original_request.expandedPaths:
                 original_request.expandedPaths.remove(request.path)
 
+        # Read just the drilled subtree from the pre-aggregated rollup
+        if pivot_service._supports_rollup(original_request.configuration):
+            try:
+                return pivot_service.compute_drill(request, cached_data)
+            except duckdb.CatalogException as e:
+                logger.warning(f"Rollup for {request.cacheKey} unavailable, recomputing: {e}")
+
         # Recompute with updated paths
         return pivot_service.compute_pivot(original_request)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Export pivot table
 @app.post("/pivot/export/{format}")
-async def export_pivot(format: str, request: PivotRequest, export_config: ExportConfig):
+def export_pivot(format: str, request: PivotRequest, export_config: ExportConfig):
     """Export pivot table in specified format"""
     try:
         # Compute the pivot first
@@ -611,35 +1495,6 @@ async def export_pivot(format: str, request: PivotRequest, export_config: Export
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# Background task to clean up cache
-async def cleanup_cache():
-    """Clean up expired cache entries"""
-    while True:
-        try:
-            current_time = datetime.now()
-            expired_keys = []
-
-            for key, data in pivot_cache.items():
-                if current_time - data['timestamp'] > CACHE_TTL:
-                    expired_keys.append(key)
-
-            for key in expired_keys:
-                del pivot_cache[key]
-
-            logger.info(f"Cleaned up {len(expired_keys)} expired cache entries")
-
-        except Exception as e:
-            logger.error(f"Error in cache cleanup: {e}")
-
-        # Wait 5 minutes before next cleanup
-        await asyncio.sleep(300)
-
-# Start background tasks
-@app.on_event("startup")
-async def startup_event():
-    """Start background tasks"""
-    asyncio.create_task(cleanup_cache())
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
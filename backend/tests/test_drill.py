@@ -0,0 +1,124 @@
+"""Drill-downs read from the rollup table must agree with the full pivot"""
+
+import duckdb
+import pandas as pd
+import pytest
+
+from pivot_api import (
+    DuckDBPivotService,
+    PivotConfiguration,
+    PivotDrillRequest,
+    PivotField,
+    PivotRequest,
+    PivotValueField,
+    pivot_cache,
+    pivot_cache_lock,
+)
+
+SALES = [
+    ("North", "A", "Q1", 10),
+    ("North", "A", "Q2", 20),
+    ("North", "A", "Q2", 30),
+    ("North", "B", "Q1", 40),
+    ("South", "A", "Q2", 50),
+    ("South", "C", "Q1", 60),
+    ("South", "C", "Q1", 60),
+    ("South", "C", "Q3", 70),
+]
+
+
+@pytest.fixture
+def service(tmp_path):
+    conn = duckdb.connect(str(tmp_path / "sales.duckdb"))
+    conn.execute("CREATE TABLE sales (region VARCHAR, category VARCHAR, quarter VARCHAR, amount INTEGER)")
+    conn.executemany("INSERT INTO sales VALUES (?, ?, ?, ?)", SALES)
+    conn.close()
+
+    with pivot_cache_lock:
+        pivot_cache.clear()
+    yield DuckDBPivotService(tmp_path, pool_size=1)
+    with pivot_cache_lock:
+        pivot_cache.clear()
+
+
+def field(field_id, data_type="string"):
+    return PivotField(id=field_id, name=field_id, dataType=data_type)
+
+
+def make_request(aggregations, rows=("region", "category"), max_columns=None):
+    return PivotRequest(
+        dataset="sales",
+        configuration=PivotConfiguration(
+            rows=[field(row) for row in rows],
+            columns=[field("quarter")],
+            values=[
+                PivotValueField(field=field("amount", "number"), aggregation=aggregation, displayName=aggregation)
+                for aggregation in aggregations
+            ],
+            maxColumns=max_columns,
+        ),
+    )
+
+
+def matrix(response):
+    return [[None if pd.isna(cell.value) else cell.value for cell in row] for row in response.structure.matrix]
+
+
+def labels(response):
+    return [header.label for header in response.structure.columnHeaders[0]]
+
+
+def drill(service, cache_key, path, action="expand"):
+    with pivot_cache_lock:
+        cached_data = pivot_cache[cache_key]
+    return service.compute_drill(PivotDrillRequest(cacheKey=cache_key, path=path, action=action), cached_data)
+
+
+@pytest.mark.parametrize("aggregations", [["sum"], ["count"], ["countDistinct"], ["min", "max"], []])
+def test_leaf_drill_matches_full_pivot(service, aggregations):
+    full = service.compute_pivot(make_request(aggregations))
+    cache_key = full.metadata["cacheKey"]
+
+    for region in ("North", "South"):
+        drilled = drill(service, cache_key, [region])
+        assert labels(drilled) == labels(full)
+        assert sorted(matrix(drilled), key=lambda row: row[1]) == sorted(
+            (row for row in matrix(full) if row[0] == region), key=lambda row: row[1]
+        )
+
+
+def test_top_level_drill_matches_single_row_dimension_pivot(service):
+    aggregations = ["sum", "count"]
+    by_region = service.compute_pivot(make_request(aggregations, rows=("region",)))
+    cache_key = service.compute_pivot(make_request(aggregations)).metadata["cacheKey"]
+
+    expanded = [[row[0]] + row[2:] for row in matrix(drill(service, cache_key, []))]
+    assert sorted(expanded) == sorted(matrix(by_region))
+
+    collapsed = [[row[0]] + row[2:] for row in matrix(drill(service, cache_key, ["North"], "collapse"))]
+    assert collapsed == [row for row in matrix(by_region) if row[0] == "North"]
+
+
+def test_drill_keeps_the_full_pivots_columns(service):
+    full = service.compute_pivot(make_request(["sum"], max_columns=1))
+    drilled = drill(service, full.metadata["cacheKey"], ["North"])
+
+    assert labels(full) == ["region", "category", "Q1_sum"]
+    assert labels(drilled) == labels(full)
+
+
+def test_rollup_is_built_once_on_first_drill(service):
+    request = make_request(["sum"])
+    cache_key = service.compute_pivot(request).metadata["cacheKey"]
+    with pivot_cache_lock:
+        assert pivot_cache[cache_key]["rollupTable"] is None
+
+    drill(service, cache_key, ["North"])
+    service.compute_pivot(request)
+    drill(service, cache_key, ["South"])
+
+    with service.acquire("sales") as conn:
+        rollups = conn.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE database_name = 'memory' AND table_name LIKE 'pivot_agg_%'"
+        ).fetchone()[0]
+    assert rollups == 1
@@ -0,0 +1,57 @@
+"""The JSON pivot endpoints encode DECIMAL aggregates and nulls the same way"""
+
+import duckdb
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+import pivot_api
+from pivot_api import DuckDBPivotService, pivot_cache, pivot_cache_lock
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    conn = duckdb.connect(str(tmp_path / "sales.duckdb"))
+    conn.execute("CREATE TABLE sales (region VARCHAR, amount DECIMAL(10, 2), qty INTEGER)")
+    conn.execute("INSERT INTO sales VALUES ('North', 1.25, 1), ('North', 2.50, NULL), ('South', 0.10, NULL)")
+    conn.close()
+
+    monkeypatch.setattr(pivot_api, "pivot_service", DuckDBPivotService(tmp_path, pool_size=1))
+    with pivot_cache_lock:
+        pivot_cache.clear()
+    yield TestClient(pivot_api.app)
+    with pivot_cache_lock:
+        pivot_cache.clear()
+
+
+def field(field_id, data_type):
+    return {"id": field_id, "name": field_id, "dataType": data_type}
+
+
+REQUEST = {
+    "dataset": "sales",
+    "configuration": {
+        "rows": [field("region", "string")],
+        "columns": [],
+        "values": [
+            {"field": field("amount", "number"), "aggregation": "sum"},
+            {"field": field("qty", "number"), "aggregation": "sum"},
+        ],
+    },
+}
+
+EXPECTED = [["North", 3.75, 1], ["South", 0.1, None]]
+
+
+def test_json_endpoints_agree(client):
+    compute = client.post("/pivot/compute", json=REQUEST)
+    matrix = [[cell["value"] for cell in row] for row in compute.json()["structure"]["matrix"]]
+    assert sorted(matrix) == EXPECTED
+
+    columnar = client.post("/pivot/compute_columnar", json=REQUEST)
+    assert columnar.headers["content-type"] == "application/json"
+    assert sorted(map(list, zip(*columnar.json()["structure"]["values"]))) == EXPECTED
+
+    stream = client.post("/pivot/compute_stream", json=REQUEST)
+    rows = [orjson.loads(line) for line in stream.content.splitlines()]
+    assert sorted([row["region"], row["amount"], row["qty"]] for row in rows) == EXPECTED
@@ -0,0 +1,28 @@
+"""Client errors from /datasets/{dataset}/optimize keep their status code"""
+
+import duckdb
+import pytest
+from fastapi.testclient import TestClient
+
+import pivot_api
+from pivot_api import DuckDBPivotService
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    conn = duckdb.connect(str(tmp_path / "sales.duckdb"))
+    conn.execute("CREATE TABLE sales AS SELECT i AS id, i % 4 AS region FROM range(100) t(i)")
+    conn.close()
+
+    monkeypatch.setattr(pivot_api, "pivot_service", DuckDBPivotService(tmp_path, pool_size=1))
+    return TestClient(pivot_api.app)
+
+
+def test_unknown_order_by_field_is_a_bad_request(client):
+    response = client.post("/datasets/sales/optimize", params={"orderBy": "missing"})
+    assert response.status_code == 400
+
+
+def test_unknown_dataset_is_not_found(client):
+    response = client.post("/datasets/missing/optimize")
+    assert response.status_code == 404
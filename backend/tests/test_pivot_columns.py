@@ -0,0 +1,63 @@
+"""maxColumns bounds the combined column tuples, not each column dimension"""
+
+import duckdb
+import pytest
+
+from pivot_api import (
+    DuckDBPivotService,
+    PivotConfiguration,
+    PivotField,
+    PivotRequest,
+    PivotValueField,
+    pivot_cache,
+    pivot_cache_lock,
+)
+
+
+@pytest.fixture
+def service(tmp_path):
+    conn = duckdb.connect(str(tmp_path / "grid.duckdb"))
+    conn.execute(
+        "CREATE TABLE grid AS SELECT i % 3 AS g, i % 10 AS a, i % 7 AS b, i % 5 AS c, i AS amount FROM range(2000) t(i)"
+    )
+    conn.close()
+
+    with pivot_cache_lock:
+        pivot_cache.clear()
+    yield DuckDBPivotService(tmp_path, pool_size=1)
+    with pivot_cache_lock:
+        pivot_cache.clear()
+
+
+def field(field_id):
+    return PivotField(id=field_id, name=field_id, dataType="number")
+
+
+@pytest.mark.parametrize("max_columns, columns, expected", [
+    (20, ["a"], 10),
+    (9, ["a"], 9),
+    (16, ["a", "b"], 16),
+    (20, ["a", "b"], 16),
+    (8, ["a", "b", "c"], 8),
+    (1, ["a", "b", "c"], 1),
+])
+def test_max_columns_caps_combined_columns(service, max_columns, columns, expected):
+    request = PivotRequest(
+        dataset="grid",
+        configuration=PivotConfiguration(
+            rows=[field("g")],
+            columns=[field(column) for column in columns],
+            values=[PivotValueField(field=field("amount"), aggregation="sum")],
+            maxColumns=max_columns,
+        ),
+    )
+    response = service.compute_pivot(request)
+
+    assert len(response.structure.columnHeaders[0]) - 1 == expected
+
+
+def test_per_dimension_limit_is_exact_integer_root():
+    assert DuckDBPivotService._per_dimension_limit(1000, 3) == 10
+    assert DuckDBPivotService._per_dimension_limit(999, 3) == 9
+    assert DuckDBPivotService._per_dimension_limit(1000, 1) == 1000
+    assert DuckDBPivotService._per_dimension_limit(3, 2) == 1